@@ -9,7 +9,21 @@ from email.mime.multipart import MIMEMultipart
 from zoneinfo import ZoneInfo
 from collections import defaultdict
 import os
-from io import BytesIO
+import time
+import copy
+import functools
+import atexit
+import threading
+import json
+import base64
+from io import BytesIO, StringIO
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import psycopg2  # optional: only for the PG_DSN bulk-import path
+except ImportError:
+    psycopg2 = None
 
 # ✅ Page config MUST be the first Streamlit call or favicon/logo can be ignored
 st.set_page_config(page_title="Client Prospect CRM", page_icon="logo.png", layout="wide")
@@ -21,16 +35,45 @@ EMAIL_HOST = st.secrets["EMAIL_HOST"]
 EMAIL_PORT = st.secrets["EMAIL_PORT"]
 EMAIL_USER = st.secrets["EMAIL_USER"]
 EMAIL_PASSWORD = st.secrets["EMAIL_PASSWORD"]
+PG_DSN = st.secrets.get("PG_DSN")  # optional direct Postgres connection string for admin CSV imports
+
+# One client per browser session, reused across reruns so its HTTP connection pool stays warm.
+# Not st.cache_resource: the client holds the signed-in user's auth session, which must not be shared.
+def get_supabase() -> Client:
+    if "sb_client" not in st.session_state:
+        st.session_state["sb_client"] = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return st.session_state["sb_client"]
+
+supabase: Client = get_supabase()
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+def _jwt_exp(token):
+    """`exp` claim of a JWT, decoded locally without verifying the signature (only used to time refreshes)."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get("exp", 0)
+    except Exception:
+        return 0
 
 # 🔐 Restore Supabase session across Streamlit reruns (prevents logout on UI interactions)
-if "sb_session" in st.session_state and st.session_state["sb_session"]:
+# The session's client keeps its auth between reruns, and gotrue's auto-refresh rotates its refresh
+# token in the background. So the client's live session is the source of truth: it's copied back into
+# session_state every rerun, and the stored tokens are only used to seed a client that has none.
+_sb_tokens = st.session_state.get("sb_session") or {}
+if _sb_tokens.get("access_token"):
     try:
-        supabase.auth.set_session(
-            st.session_state["sb_session"].get("access_token"),
-            st.session_state["sb_session"].get("refresh_token"),
-        )
+        live = supabase.auth.get_session()
+        if live is None:
+            res = supabase.auth.set_session(_sb_tokens["access_token"], _sb_tokens.get("refresh_token"))
+            live = getattr(res, "session", None)
+        if live is not None and _jwt_exp(live.access_token) - time.time() <= 60:
+            # No argument: refresh with the client's current (possibly rotated) refresh token
+            live = getattr(supabase.auth.refresh_session(), "session", None) or live
+        if live is not None:
+            st.session_state["sb_session"] = {
+                "access_token": live.access_token,
+                "refresh_token": live.refresh_token,
+            }
     except Exception:
         # If token expired/invalid, user can sign in again
         pass
@@ -38,6 +81,8 @@ if "sb_session" in st.session_state and st.session_state["sb_session"]:
 # === Branding header ===
 header_left, header_right = st.columns([3, 8])   # wider left column
 
+# Looked up once per server process, not on every rerun
+@st.cache_resource
 def _find_logo():
     for p in ("assets/logo.png", "logo.png"):
         if os.path.exists(p):
@@ -59,36 +104,12 @@ CLIENT_OPTIONS = [
 ]
 
 # Optional: sidebar logo
-if _find_logo():
-    st.sidebar.image(_find_logo(), use_container_width=True)
+if _logo:
+    st.sidebar.image(_logo, use_container_width=True)
 
-# === Auth UI (required for RLS to identify users) ===
-st.sidebar.markdown("### 🔐 Sign in")
-email_login = st.sidebar.text_input("Email", key="login_email")
-password_login = st.sidebar.text_input("Password", type="password", key="login_pw")
-col_a, col_b = st.sidebar.columns(2)
-if col_a.button("Sign in"):
-    try:
-        auth_res = supabase.auth.sign_in_with_password({"email": email_login, "password": password_login})
-        sess = getattr(auth_res, "session", None) or auth_res
-        # Save tokens so auth survives Streamlit reruns
-        st.session_state["sb_session"] = {
-            "access_token": getattr(sess, "access_token", None),
-            "refresh_token": getattr(sess, "refresh_token", None),
-        }
-        st.session_state["session"] = sess
-        st.success("Signed in.")
-        st.rerun()
-    except Exception as e:
-        st.error(f"Sign-in failed: {e}")
-if col_b.button("Sign out"):
-    try:
-        supabase.auth.sign_out()
-    except Exception:
-        pass
-    st.session_state.pop("session", None)
-    st.session_state.pop("sb_session", None)
-    st.rerun()
+# Access token of the signed-in user (None when signed out); used as the cache key for auth lookups
+def _access_token():
+    return (st.session_state.get("sb_session") or {}).get("access_token")
 
 # Helper to get current user email from session
 def _current_user_email():
@@ -105,9 +126,37 @@ def _current_user_email():
     except Exception:
         return None
 
+def _clear_auth_cache():
+    st.session_state.pop("_access_cache", None)
+    st.session_state.pop("_access_cache_token", None)
+    st.session_state.pop("_bootstrap", None)
+    # Edits/emails queued by the previous user must never be saved under the next user's token
+    st.session_state.pop("pending_edits", None)
+    st.session_state.pop("pending_emails", None)
+
 # ---- Access helpers (UI convenience; RLS is the real gate) ----
-def get_user_access():
-    """Return dict(email, allowed_clients, is_admin). Requires authenticated session."""
+def _access_from_row(email, row) -> dict:
+    allowed = row.get("allowed_clients") or []
+    is_admin = bool(row.get("is_admin", False))
+    if is_admin:
+        allowed = CLIENT_OPTIONS
+    return {"email": email, "allowed_clients": allowed, "is_admin": is_admin}
+
+def _fetch_bootstrap():
+    """Email, user_access row, reminder frequency and prospect estimate in one round-trip
+    (get_bootstrap RPC, see README). None if the function isn't installed."""
+    try:
+        boot = supabase.rpc("get_bootstrap").execute().data
+    except Exception:
+        return None
+    return boot if isinstance(boot, dict) and boot.get("email") else None
+
+def _fetch_user_access() -> dict:
+    boot = _fetch_bootstrap()
+    if boot:
+        # First paint after sign-in reads reminder frequency and row count from here too
+        st.session_state["_bootstrap"] = boot
+        return _access_from_row(boot["email"], boot.get("access") or {})
     email = _current_user_email()
     if not email:
         return {"email": None, "allowed_clients": [], "is_admin": False}
@@ -122,23 +171,130 @@ def get_user_access():
         row = getattr(ua, "data", None) or {}
     except Exception:
         row = {}
-    allowed = row.get("allowed_clients") or []
-    is_admin = bool(row.get("is_admin", False))
-    if is_admin:
-        allowed = CLIENT_OPTIONS
-    return {"email": email, "allowed_clients": allowed, "is_admin": is_admin}
+    return _access_from_row(email, row)
+
+def get_user_access():
+    """Return dict(email, allowed_clients, is_admin). Requires authenticated session.
+    Cached in this session's state (not st.cache_data, which is shared by every user) until the token changes."""
+    token = _access_token()
+    if not token:
+        return {"email": None, "allowed_clients": [], "is_admin": False}
+    if st.session_state.get("_access_cache_token") == token:
+        return st.session_state["_access_cache"]
+    access = _fetch_user_access()
+    if access["email"]:  # don't pin a failed lookup until the next token refresh
+        st.session_state["_access_cache_token"] = token
+        st.session_state["_access_cache"] = access
+    return access
+
+# === Auth UI (required for RLS to identify users) ===
+st.sidebar.markdown("### 🔐 Sign in")
+email_login = st.sidebar.text_input("Email", key="login_email")
+password_login = st.sidebar.text_input("Password", type="password", key="login_pw")
+col_a, col_b = st.sidebar.columns(2)
+if col_a.button("Sign in"):
+    try:
+        auth_res = supabase.auth.sign_in_with_password({"email": email_login, "password": password_login})
+        sess = getattr(auth_res, "session", None) or auth_res
+        # Save tokens so auth survives Streamlit reruns
+        st.session_state["sb_session"] = {
+            "access_token": getattr(sess, "access_token", None),
+            "refresh_token": getattr(sess, "refresh_token", None),
+        }
+        st.session_state["session"] = sess
+        _clear_auth_cache()
+        st.success("Signed in.")
+        st.rerun()
+    except Exception as e:
+        st.error(f"Sign-in failed: {e}")
+if col_b.button("Sign out"):
+    try:
+        supabase.auth.sign_out()
+    except Exception:
+        pass
+    st.session_state.pop("session", None)
+    st.session_state.pop("sb_session", None)
+    _clear_auth_cache()
+    st.rerun()
 
 # Block app if not signed in (so UI mirrors RLS)
 access = get_user_access()
 USER_EMAIL = access["email"]
 ALLOWED = access["allowed_clients"]
 IS_ADMIN = access["is_admin"]
+# O(1) membership for the per-client checks below (form sanitization, CSV upload)
+ALLOWED_SET = frozenset(ALLOWED)
+CLIENT_OPTIONS_SET = frozenset(CLIENT_OPTIONS)
 if USER_EMAIL is None:
     st.warning("Please sign in to view and manage prospects.")
     st.stop()
+# Bootstrap values are only used once; later reruns go through the regular (cached) reads
+_boot = st.session_state.pop("_bootstrap", None) or {}
 
 # === Function to Send Email (used for one-off updates, not reminders) ===
-def send_email(to_address, subject, body):
+class _SMTPPool:
+    """One logged-in SMTP connection reused across sends; reconnects once if the server dropped it."""
+
+    def __init__(self):
+        self._server = None
+        self._lock = threading.Lock()  # smtplib connections aren't safe to share between threads
+
+    def get(self):
+        if self._server is None:
+            server = smtplib.SMTP(EMAIL_HOST, EMAIL_PORT, timeout=30)
+            try:
+                server.starttls()
+                server.login(EMAIL_USER, EMAIL_PASSWORD)
+            except Exception:
+                # Don't leak the half-open socket when STARTTLS or LOGIN fails
+                try:
+                    server.close()
+                except Exception:
+                    pass
+                raise
+            self._server = server
+        return self._server
+
+    def _drop(self):
+        if self._server is not None:
+            try:
+                self._server.close()
+            except Exception:
+                pass
+        self._server = None
+
+    def send(self, msg):
+        with self._lock:
+            try:
+                self.get().send_message(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # Idle connections get closed server-side; retry once on a fresh login.
+                # Other SMTP errors (refused recipient, rejected data) propagate: a resend could duplicate
+                self._drop()
+                self.get().send_message(msg)
+
+    def close(self):
+        with self._lock:
+            if self._server is not None:
+                try:
+                    self._server.quit()
+                except Exception:
+                    pass
+            self._server = None
+
+@st.cache_resource
+def _smtp_pool():
+    pool = _SMTPPool()
+    atexit.register(pool.close)
+    return pool
+
+# Shared across sessions; SMTP runs off the script thread so the UI doesn't wait on the send.
+# One worker: sends go through the single pooled connection anyway.
+@st.cache_resource
+def _email_pool():
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="crm-email")
+
+def _deliver_email(smtp, to_address, subject, body):
     msg = MIMEMultipart()
     msg['From'] = EMAIL_USER
     msg['To'] = to_address
@@ -146,18 +302,162 @@ def send_email(to_address, subject, body):
     msg.attach(MIMEText(body, 'plain'))
 
     try:
-        with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT) as server:
-            server.starttls()
-            server.login(EMAIL_USER, EMAIL_PASSWORD)
-            server.send_message(msg)
+        smtp.send(msg)
+    except Exception as e:
+        # No Streamlit context on the worker thread; report to the server log instead of st.error
+        print(f"Failed to send email to {to_address}: {e}")
+
+def send_email(to_address, subject, body):
+    # Resolve the cached pool here: st.cache_resource needs the script thread's context
+    _email_pool().submit(_deliver_email, _smtp_pool(), to_address, subject, body)
+
+# === Supabase call helper ===
+def exec_sb(builder, expect_rows=True):
+    """Execute a PostgREST builder; return (rows, None) on success or (None, error message).
+    With expect_rows, an empty result (e.g. filtered out by RLS) also counts as an error."""
+    try:
+        resp = builder.execute()
     except Exception as e:
-        st.error(f"Failed to send email to {to_address}: {e}")
+        return None, str(e)
+    data = getattr(resp, "data", None)
+    if expect_rows and not data:
+        return None, str(getattr(resp, "error", None) or "No rows returned.")
+    return data, None
+
+# === Cached prospect reads (keyed by user so RLS-scoped results never mix) ===
+# Columns the UI displays/edits; fetched explicitly instead of select("*")
+PROSPECT_COLUMNS = [
+    "id", "first_name", "last_name", "title", "company", "phone", "email",
+    "address", "website", "assigned_to_email", "follow_up_date", "clients", "notes",
+]
+
+def _clients_or_filter(codes):
+    """PostgREST or= filter matching rows whose comma-separated clients mention any code.
+    Substring match is exact here because no client code is a substring of another."""
+    return ",".join(f"clients.ilike.*{c}*" for c in codes)
+
+# Rows per page in the prospect view (fetched with .range(), not sliced client-side)
+PAGE_SIZE = 100
+
+def _scoped_query(columns, allowed, is_admin, filter_clients=(), filter_owners=(), count=None):
+    """prospects query with the client restriction and filters applied; None when no row can match."""
+    # A client filter narrows the non-admin restriction (its choices are a subset of allowed)
+    if filter_clients:
+        codes = [c for c in filter_clients if is_admin or c in allowed]
+    else:
+        codes = [] if is_admin else list(allowed)
+    if not is_admin and not codes:
+        return None
+    q = supabase.table("prospects").select(columns, count=count)
+    if codes:
+        q = q.or_(_clients_or_filter(codes))
+    if filter_owners:
+        q = q.in_("assigned_to_email", list(filter_owners))
+    return q
+
+PROSPECTS_TTL = 30  # default seconds a cached prospect read is reused within a session
+
+def _session_cached(ttl=PROSPECTS_TTL):
+    """Cache a prospect read in this session's state (not st.cache_data, which is shared by every user)
+    for ttl seconds, or until _invalidate_prospects() drops this session's entries after a write.
+    Like st.cache_data, callers get a copy, so mutating a returned frame never changes the cache."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def cached(*args, **kwargs):
+            cache = st.session_state.setdefault("_prospects_cache", {})
+            now = time.monotonic()
+            key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+            hit = cache.get(key)
+            if hit and now - hit[0] < ttl:
+                return copy.deepcopy(hit[2])
+            result = fn(*args, **kwargs)
+            # Drop expired entries so paging/filtering doesn't grow the dict for the whole session
+            for k in [k for k, (ts, t, _) in cache.items() if now - ts >= t]:
+                del cache[k]
+            cache[key] = (now, ttl, copy.deepcopy(result))
+            return result
+        return cached
+    return wrap
+
+def _fetch_prospects(allowed, is_admin, filter_clients, filter_owners, page, page_size):
+    q = _scoped_query(",".join(PROSPECT_COLUMNS), allowed, is_admin, filter_clients, filter_owners,
+                      count=("exact" if page else None))
+    if q is None:
+        return pd.DataFrame(columns=PROSPECT_COLUMNS), 0
+    q = q.order("follow_up_date")
+    if page:
+        start = (page - 1) * page_size
+        q = q.range(start, start + page_size - 1)
+    data = q.execute()
+    rows = getattr(data, "data", []) or []
+    total = getattr(data, "count", None) if page else None
+    return pd.DataFrame(rows, columns=PROSPECT_COLUMNS), (len(rows) if total is None else total)
+
+@_session_cached()
+def load_prospects(user_email: str, allowed: tuple, is_admin: bool, filter_clients: tuple = (),
+                   filter_owners: tuple = (), page: int = None, page_size: int = PAGE_SIZE):
+    """Return (DataFrame, total matches) sorted by follow_up_date; only one page of rows when page is given."""
+    return _fetch_prospects(allowed, is_admin, filter_clients, filter_owners, page, page_size)
+
+@_session_cached(ttl=60)
+def load_owner_choices(user_email: str, allowed: tuple, is_admin: bool, filter_clients: tuple = ()) -> list:
+    q = _scoped_query("assigned_to_email", allowed, is_admin, filter_clients)
+    if q is None:
+        return []
+    rows = getattr(q.execute(), "data", []) or []
+    return sorted({r["assigned_to_email"] for r in rows if r.get("assigned_to_email")})
+
+@_session_cached()
+def search_prospects(user_email: str, allowed: tuple, is_admin: bool, term: str, filter_clients: tuple = (),
+                     filter_owners: tuple = (), limit: int = 20) -> list:
+    """Up to `limit` (id, first/last name, company, email) rows within the active filters whose
+    name, company or email contains term."""
+    # , ( ) * " are reserved inside a PostgREST or= expression
+    term = "".join(ch for ch in term if ch not in ',()*"').strip()
+    q = _scoped_query("id,first_name,last_name,company,email", allowed, is_admin, filter_clients, filter_owners)
+    if q is None or not term:
+        return []
+    fields = ("first_name", "last_name", "company", "email")
+    q = q.or_(",".join(f"{f}.ilike.*{term}*" for f in fields))
+    return getattr(q.order("last_name").limit(limit).execute(), "data", []) or []
+
+@_session_cached()
+def fetch_prospect(user_email: str, prospect_id):
+    res = supabase.table("prospects").select(",".join(PROSPECT_COLUMNS)).eq("id", prospect_id).single().execute()
+    return getattr(res, "data", None)
+
+@_session_cached()
+def load_due_prospects(user_email: str, allowed: tuple, is_admin: bool, window_end_iso: str) -> pd.DataFrame:
+    cols = ["id", "first_name", "last_name", "company", "follow_up_date", "assigned_to_email"]
+    q = _scoped_query(",".join(cols), allowed, is_admin)
+    if q is None:
+        return pd.DataFrame(columns=cols)
+    data = q.lte("follow_up_date", window_end_iso).order("follow_up_date").execute()
+    return pd.DataFrame(getattr(data, "data", []) or [], columns=cols)
+
+@_session_cached(ttl=300)
+def count_prospects(user_email: str) -> int:
+    """Approximate prospects row count from pg_class.reltuples (O(1)); PostgREST's estimate if the RPC is unavailable."""
+    try:
+        est = supabase.rpc("get_prospects_estimate").execute()
+        if est.data is not None and int(est.data) >= 0:  # -1 until the table has been analyzed
+            return int(est.data)
+    except Exception:
+        pass
+    # HEAD request: only the Content-Range count comes back, no rows
+    count_res = supabase.table("prospects").select("id", count="estimated", head=True).execute()
+    return getattr(count_res, "count", 0) or 0
+
+def _invalidate_prospects():
+    """Drop this session's cached prospect reads after any insert/update/delete."""
+    st.session_state.pop("_prospects_cache", None)
 
 # === Live Usage Summary ===
 try:
-    count_res = supabase.table("prospects").select("id", count="exact").execute()
-    row_count = getattr(count_res, "count", 0) or 0
-    st.sidebar.markdown(f"### 📊 Total Prospects: {row_count}")
+    row_count = _boot.get("prospect_count")
+    if row_count is None or row_count < 0:  # -1 until the table has been analyzed
+        row_count = count_prospects(USER_EMAIL)
+    st.sidebar.markdown(f"### 📊 Total Prospects: ≈{row_count}")
     if row_count > 18000:
         st.sidebar.warning("⚠️ Approaching Supabase Free Tier limit (20,000 rows)")
 except Exception:
@@ -168,17 +468,19 @@ if IS_ADMIN:
     st.sidebar.markdown("### ⏰ Reminder Settings")
 
     # fetch or initialize setting
-    try:
-        res = supabase.table("reminder_settings").select("frequency").eq("id", 1).single().execute()
-        if res.data:
-            current_freq = res.data.get("frequency", "daily")
-        else:
-            # auto-seed with default daily if missing
-            supabase.table("reminder_settings").upsert({"id": 1, "frequency": "daily"}).execute()
+    current_freq = _boot.get("reminder_freq")
+    if current_freq is None:
+        try:
+            res = supabase.table("reminder_settings").select("frequency").eq("id", 1).single().execute()
+            if res.data:
+                current_freq = res.data.get("frequency", "daily")
+            else:
+                # auto-seed with default daily if missing
+                supabase.table("reminder_settings").upsert({"id": 1, "frequency": "daily"}).execute()
+                current_freq = "daily"
+        except Exception:
+            # if table missing or other error, default
             current_freq = "daily"
-    except Exception:
-        # if table missing or other error, default
-        current_freq = "daily"
 
     freq_choice = st.sidebar.radio(
         "Email reminder frequency",
@@ -188,76 +490,75 @@ if IS_ADMIN:
     )
 
     if st.sidebar.button("Save Reminder Setting"):
-        try:
-            supabase.table("reminder_settings").upsert({"id": 1, "frequency": freq_choice}).execute()
+        _, err = exec_sb(supabase.table("reminder_settings").upsert({"id": 1, "frequency": freq_choice}), expect_rows=False)
+        if err:
+            st.sidebar.error(f"Failed to update: {err}")
+        else:
             st.sidebar.success(f"Reminder frequency set to {freq_choice}")
-        except Exception as e:
-            st.sidebar.error(f"Failed to update: {e}")
 
 # === Form to Add New Prospect ===
-st.sidebar.header("➕ Add New Prospect")
-clients_choices_for_user = CLIENT_OPTIONS if IS_ADMIN else ALLOWED
-with st.sidebar.form("add_prospect"):
-    first = st.text_input("First Name")
-    last = st.text_input("Last Name")
-    title = st.text_input("Title")
-    company = st.text_input("Company")
-    phone = st.text_input("Phone")
-    email = st.text_input("Email")
-    address = st.text_area("Address")
-    website = st.text_input("Website")
-    assigned_to = st.text_input("Assigned To (Email)")
-    clients = st.multiselect("Assign to Client(s)", clients_choices_for_user)
-    notes = st.text_area("Notes")
-    follow_up = st.date_input("Follow-Up Date", value=datetime.today() + timedelta(days=7))
-    submitted = st.form_submit_button("Add Prospect")
-
-    if submitted:
-        safe_clients = clients if IS_ADMIN else [c for c in clients if c in ALLOWED]
-        data = {
-            "first_name": first,
-            "last_name": last,
-            "title": title,
-            "company": company,
-            "phone": phone,
-            "email": email,
-            "address": address,
-            "website": website,
-            "assigned_to_email": assigned_to,
-            "follow_up_date": follow_up.strftime("%Y-%m-%d"),
-            "notes": notes,
-            "clients": ",".join(safe_clients),
-        }
-        try:
-            resp = supabase.table("prospects").insert(data).execute()
-            if getattr(resp, "data", None):
-                st.success("Prospect added successfully!")
+# Built only while toggled open: a collapsed expander would still construct every input on each rerun
+if st.sidebar.toggle("➕ Add New Prospect", key="show_add_prospect"):
+    clients_choices_for_user = CLIENT_OPTIONS if IS_ADMIN else ALLOWED
+    with st.sidebar.form("add_prospect"):
+        first = st.text_input("First Name")
+        last = st.text_input("Last Name")
+        title = st.text_input("Title")
+        company = st.text_input("Company")
+        phone = st.text_input("Phone")
+        email = st.text_input("Email")
+        address = st.text_area("Address")
+        website = st.text_input("Website")
+        assigned_to = st.text_input("Assigned To (Email)")
+        clients = st.multiselect("Assign to Client(s)", clients_choices_for_user)
+        notes = st.text_area("Notes")
+        follow_up = st.date_input("Follow-Up Date", value=datetime.today() + timedelta(days=7))
+        submitted = st.form_submit_button("Add Prospect")
+
+        if submitted:
+            safe_clients = clients if IS_ADMIN else [c for c in clients if c in ALLOWED_SET]
+            data = {
+                "first_name": first,
+                "last_name": last,
+                "title": title,
+                "company": company,
+                "phone": phone,
+                "email": email,
+                "address": address,
+                "website": website,
+                "assigned_to_email": assigned_to,
+                "follow_up_date": follow_up.strftime("%Y-%m-%d"),
+                "notes": notes,
+                "clients": ",".join(safe_clients),
+            }
+            _, err = exec_sb(supabase.table("prospects").insert(data))
+            if err:
+                st.error(f"Failed to add prospect: {err}")
             else:
-                err = getattr(resp, "error", None)
-                st.error(f"Failed to add prospect. {err or 'No rows returned.'}")
-        except Exception as e:
-            st.error(f"Failed to add prospect: {e}")
+                _invalidate_prospects()
+                st.success("Prospect added successfully!")
 
 # === Upload Prospects CSV ===
 st.sidebar.header("📄 Upload Prospects CSV")
 
+CSV_TEMPLATE_COLUMNS = [
+    "first_name",
+    "last_name",
+    "title",
+    "company",
+    "phone",
+    "email",
+    "address",
+    "website",
+    "assigned_to_email",
+    "follow_up_date",   # YYYY-MM-DD (or leave blank)
+    "clients"           # comma-separated, e.g. "WOEMA, SCAAP"
+]
+
 # Admin-only: downloadable blank CSV template (headers only)
 if IS_ADMIN:
-    template_cols = [
-        "first_name",
-        "last_name",
-        "title",
-        "company",
-        "phone",
-        "email",
-        "address",
-        "website",
-        "assigned_to_email",
-        "follow_up_date",   # YYYY-MM-DD (or leave blank)
-        "clients"           # comma-separated, e.g. "WOEMA, SCAAP"
-    ]
     # 0-row DataFrame → headers only
-    template_df = pd.DataFrame(columns=template_cols)
+    template_df = pd.DataFrame(columns=CSV_TEMPLATE_COLUMNS)
     template_csv_bytes = template_df.to_csv(index=False).encode("utf-8")
     st.sidebar.download_button(
         "⬇️ Download CSV Template",
@@ -269,38 +570,124 @@ if IS_ADMIN:
 
 uploaded_file = st.sidebar.file_uploader("Choose a CSV file", type="csv")
 
-if uploaded_file:
-    df_upload = pd.read_csv(uploaded_file)
-    if "follow_up_date" in df_upload.columns:
-        df_upload["follow_up_date"] = pd.to_datetime(df_upload["follow_up_date"]).dt.strftime("%Y-%m-%d")
-    if "notes" in df_upload.columns:
-        df_upload.drop(columns=["notes"], inplace=True)
-    df_upload = df_upload.where(pd.notnull(df_upload), None)
-
-    # Sanitize client assignments for non-admins
-    if not IS_ADMIN and "clients" in df_upload.columns:
-        df_upload["clients"] = df_upload["clients"].fillna("")
-        df_upload["clients"] = df_upload["clients"].apply(
-            lambda s: ",".join([c for c in str(s).split(',') if c in ALLOWED])
-        )
-
+# Rows per insert call; keeps each PostgREST payload bounded and isolates a bad batch
+CSV_CHUNK_ROWS = 500
+# Bytes pyarrow parses at a time, so memory stays bounded regardless of file size
+CSV_BLOCK_BYTES = 8 << 20
+
+def _iter_upload_chunks(f):
+    """Yield DataFrames of at most CSV_CHUNK_ROWS rows, parsed block-by-block with pyarrow."""
+    reader = pacsv.open_csv(
+        f,
+        read_options=pacsv.ReadOptions(block_size=CSV_BLOCK_BYTES),
+        convert_options=pacsv.ConvertOptions(
+            # Known columns stay text (phones/zips keep leading zeros; types can't drift between blocks)
+            column_types={c: pa.string() for c in CSV_TEMPLATE_COLUMNS},
+            strings_can_be_null=True,
+        ),
+    )
+    for batch in reader:
+        for offset in range(0, batch.num_rows, CSV_CHUNK_ROWS):
+            yield batch.slice(offset, CSV_CHUNK_ROWS).to_pandas()
+
+def _sanitize_upload_chunk(chunk):
+    if "follow_up_date" in chunk.columns:
+        chunk["follow_up_date"] = pd.to_datetime(chunk["follow_up_date"]).dt.strftime("%Y-%m-%d")
+    if "notes" in chunk.columns:
+        chunk.drop(columns=["notes"], inplace=True)
+    # object dtype first: where(..., None) on a float column would just put NaN back
+    chunk = chunk.astype(object).where(chunk.notna(), None)
+
+    # Sanitize client assignments for non-admins (vectorized split/explode/isin, re-joined per row)
+    if not IS_ADMIN and "clients" in chunk.columns:
+        codes = chunk["clients"].fillna("").astype(str).str.split(",").explode().str.strip()
+        codes = codes[codes.isin(ALLOWED_SET)]
+        chunk["clients"] = codes.groupby(level=0).agg(",".join).reindex(chunk.index, fill_value="")
+    return chunk
+
+def _pg_copy_conn():
+    """Direct Postgres connection for COPY imports, or None to use PostgREST inserts.
+    Admins only: the connection bypasses RLS, and admins may write every client anyway."""
+    if not (IS_ADMIN and PG_DSN and psycopg2):
+        return None
     try:
-        resp = supabase.table("prospects").insert(df_upload.to_dict(orient="records")).execute()
-        if getattr(resp, "data", None):
-            st.success("CSV uploaded and processed successfully.")
-        else:
-            err = getattr(resp, "error", None)
-            st.error(f"CSV upload failed. {err or 'No rows returned.'}")
-    except Exception as e:
-        st.error(f"CSV upload failed: {e}")
+        return psycopg2.connect(PG_DSN)
+    except psycopg2.Error as e:
+        st.sidebar.warning(f"Direct import unavailable, using the API instead: {e}")
+        return None
 
-# === Load Prospects ===
-try:
-    data = supabase.table("prospects").select("*").execute()
-    df = pd.DataFrame(getattr(data, "data", []) or [])
-except Exception as e:
-    st.error(f"Failed to load prospects: {e}")
-    df = pd.DataFrame()
+def _copy_field(v):
+    # COPY csv: unquoted empty -> NULL, quoted -> literal text, so None and "" load exactly as the API stores them
+    return "" if v is None else '"' + str(v).replace('"', '""') + '"'
+
+def _insert_upload_chunk(chunk, pg=None):
+    """Insert one sanitized batch; return an error message or None."""
+    # COPY only for template columns: they are interpolated into the statement
+    if pg is not None and set(chunk.columns) <= set(CSV_TEMPLATE_COLUMNS):
+        buf = StringIO()
+        for row in chunk.itertuples(index=False, name=None):
+            buf.write(",".join(map(_copy_field, row)) + "\n")
+        buf.seek(0)
+        cols = ",".join(f'"{c}"' for c in chunk.columns)
+        committing = False
+        try:
+            with pg.cursor() as cur:
+                cur.copy_expert(f"COPY prospects ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+            committing = True
+            pg.commit()
+            return None
+        except psycopg2.Error as e:
+            try:
+                pg.rollback()
+            except psycopg2.Error:
+                pass  # connection already gone: rollback raises InterfaceError
+            # A dead connection before COMMIT loaded nothing, so this (and every later) batch
+            # goes through the API; a failed COMMIT may have landed, so report it instead
+            if committing or not pg.closed:
+                return str(e)
+    # return=minimal: PostgREST already runs the batch as one INSERT; skip echoing every row back
+    _, err = exec_sb(
+        supabase.table("prospects").insert(chunk.to_dict(orient="records"), returning="minimal"),
+        expect_rows=False,
+    )
+    return err
+
+# The uploader keeps its file across reruns (including the st.rerun() after edits/deletes);
+# import each upload once. Marked before inserting so a partly failed import isn't re-run either.
+if uploaded_file and uploaded_file.file_id != st.session_state.get("_imported_file_id"):
+    st.session_state["_imported_file_id"] = uploaded_file.file_id
+    progress = st.sidebar.progress(0.0)
+    pg = _pg_copy_conn()
+    inserted_rows = 0
+    failed_batches = []
+    first_row = 1
+    try:
+        for chunk in _iter_upload_chunks(uploaded_file):
+            last_row = first_row + len(chunk) - 1
+            try:
+                chunk = _sanitize_upload_chunk(chunk)
+            except Exception as e:
+                failed_batches.append(f"rows {first_row}-{last_row}: {e}")
+            else:
+                err = _insert_upload_chunk(chunk, pg)
+                if err:
+                    failed_batches.append(f"rows {first_row}-{last_row}: {err}")
+                else:
+                    inserted_rows += len(chunk)
+            first_row = last_row + 1
+            progress.progress(min(uploaded_file.tell() / max(uploaded_file.size, 1), 1.0))
+    except pa.ArrowInvalid as e:
+        failed_batches.append(f"rows {first_row}+: could not parse CSV ({e})")
+    finally:
+        if pg is not None:
+            pg.close()
+    progress.progress(1.0)
+    _invalidate_prospects()
+
+    if failed_batches:
+        st.error("CSV upload failed for " + "; ".join(failed_batches))
+    if inserted_rows:
+        st.success(f"CSV uploaded and processed successfully ({inserted_rows} rows).")
 
 # === Filters (Client + Owner) & Export ===
 client_choices = CLIENT_OPTIONS if IS_ADMIN else ALLOWED
@@ -310,19 +697,11 @@ filter_clients = st.multiselect(
     default=([] if IS_ADMIN else ALLOWED),
 )
 
-# Base frame with non-admin restriction applied first
-base_df = df.copy()
-if not IS_ADMIN and not base_df.empty:
-    # clients stored as comma-separated string; treat missing as ""
-    base_df["clients"] = base_df["clients"].fillna("")
-    base_df = base_df[base_df["clients"].apply(
-        lambda x: any(c in [v.strip() for v in str(x).split(",")] for c in ALLOWED)
-    )]
-
-# Owner choices based on allowed rows
-owner_choices = []
-if not base_df.empty and "assigned_to_email" in base_df.columns:
-    owner_choices = sorted(base_df["assigned_to_email"].dropna().unique().tolist())
+# Owner choices within the allowed/client-filtered rows (one-column query)
+try:
+    owner_choices = load_owner_choices(USER_EMAIL, tuple(ALLOWED), IS_ADMIN, tuple(filter_clients))
+except Exception:
+    owner_choices = []
 
 filter_owners = st.multiselect(
     "Filter by Owner (assigned_to_email)",
@@ -330,196 +709,270 @@ filter_owners = st.multiselect(
     default=[],
 )
 
-# Build filtered frame used for BOTH display and export
-df_filtered = base_df
+# === Export (client restriction + filters + sort applied server-side) ===
+def _export_df():
+    """Full filtered frame without ids; only loaded when an export is requested."""
+    try:
+        df_filtered, _ = load_prospects(USER_EMAIL, tuple(ALLOWED), IS_ADMIN, tuple(filter_clients), tuple(filter_owners))
+    except Exception as e:
+        st.error(f"Failed to load prospects: {e}")
+        df_filtered = pd.DataFrame(columns=PROSPECT_COLUMNS)
+    # drop() already returns a new frame; no extra .copy() of the export data
+    return df_filtered.drop(columns=["id"])
+
+def _build_csv(df):
+    # pyarrow's C++ writer, straight into bytes (no to_csv string + .encode copy)
+    buf = BytesIO()
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), buf)
+    return buf.getvalue()
+
+def _build_xlsx(df):
+    buf = BytesIO()
+    with pd.ExcelWriter(buf) as writer:
+        df.to_excel(writer, index=False, sheet_name="Prospects")
+    return buf.getvalue()
 
-# Apply client filter
-if filter_clients:
-    df_filtered = df_filtered.copy()
-    df_filtered["clients"] = df_filtered["clients"].fillna("")
-    df_filtered = df_filtered[df_filtered["clients"].apply(
-        lambda x: any(c in [v.strip() for v in str(x).split(",")] for c in filter_clients)
-    )]
+st.markdown("#### ⬇️ Export filtered prospects")
+col_csv, col_xlsx = st.columns(2)
 
-# Apply owner filter
-if filter_owners:
-    df_filtered = df_filtered[df_filtered["assigned_to_email"].isin(filter_owners)]
+# Built only when asked: neither the full download nor serialization runs on every rerun
+if col_csv.button("Prepare CSV", use_container_width=True):
+    col_csv.download_button(
+        "Download CSV",
+        data=_build_csv(_export_df()),
+        file_name="prospects_filtered.csv",
+        mime="text/csv",
+        use_container_width=True,
+    )
 
-# Sort by follow_up_date if present
-if not df_filtered.empty and "follow_up_date" in df_filtered.columns:
-    if not pd.api.types.is_datetime64_any_dtype(df_filtered["follow_up_date"]):
-        df_filtered["follow_up_date"] = pd.to_datetime(df_filtered["follow_up_date"], errors="coerce")
-    df_filtered = df_filtered.sort_values(by="follow_up_date", na_position="last")
+if col_xlsx.button("Prepare Excel (.xlsx)", use_container_width=True):
+    col_xlsx.download_button(
+        "Download Excel (.xlsx)",
+        data=_build_xlsx(_export_df()),
+        file_name="prospects_filtered.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        use_container_width=True,
+    )
 
-# Export buttons
-safe_cols = [c for c in df_filtered.columns if c != "id"]
-export_df = df_filtered[safe_cols].copy()
+# === Display (one server-side page), Search, Edit, Delete ===
+def _option_labels(df):
+    """"First Last — Company" label per row, built column-wise."""
+    fn, ln, co = (df[c].fillna("").astype(str).str.strip() for c in ("first_name", "last_name", "company"))
+    nm = (fn + " " + ln).str.strip().replace("", "(no name)")
+    return (nm + " — " + co).where(co != "", nm)
+
+# Fragment: paging, search, selection and edit widgets rerun only this view, not the whole app
+@st.fragment
+def _prospect_view(filter_clients, filter_owners):
+    # Message from a write that triggered the rerun below
+    if "_flash" in st.session_state:
+        st.success(st.session_state.pop("_flash"))
+
+    # ---- Pending edits: queued by the edit form, written together by one Save ----
+    pending_edits = st.session_state.setdefault("pending_edits", {})
+    pending_emails = st.session_state.setdefault("pending_emails", {})
+    if pending_edits:
+        col_save, col_discard = st.columns(2)
+        if col_save.button(f"💾 Save pending edits ({len(pending_edits)})", use_container_width=True):
+            # One UPDATE per id, not an upsert: needs no INSERT policy and never re-creates a row
+            # someone deleted after the edit was queued (that update matches nothing and fails)
+            errors, saved = {}, 0
+            for pid, data in list(pending_edits.items()):
+                _, err = exec_sb(supabase.table("prospects").update({k: v for k, v in data.items() if k != "id"}).eq("id", pid))
+                if err:
+                    errors[pid] = err
+                    continue
+                if pid in pending_emails:
+                    send_email(*pending_emails.pop(pid))
+                del pending_edits[pid]
+                saved += 1
+            if saved:
+                _invalidate_prospects()
+            if errors:
+                # Failed edits stay queued, so they can be retried or discarded
+                st.error(f"Saved {saved} edit(s); {len(errors)} failed and are still queued: {next(iter(errors.values()))}")
+            else:
+                st.session_state["_flash"] = f"Saved {saved} edit(s)."
+                st.rerun()  # whole app: the count and reminders outside this fragment read the same rows
+        if col_discard.button("Discard pending edits", use_container_width=True):
+            pending_edits.clear()
+            pending_emails.clear()
+
+    # The view is driven by the page query (and its count), not by the full export frame
+    # New filters start back at page 1 (set before the Page widget is built this run)
+    if st.session_state.get("_page_filters") != (filter_clients, filter_owners):
+        st.session_state["_page_filters"] = (filter_clients, filter_owners)
+        st.session_state["prospect_page"] = 1
+    page = int(st.session_state.get("prospect_page", 1))
+
+    def _load_page(p):
+        return load_prospects(USER_EMAIL, tuple(ALLOWED), IS_ADMIN, filter_clients, filter_owners, p, PAGE_SIZE)
 
-st.markdown("#### ⬇️ Export filtered prospects")
-col_csv, col_xlsx = st.columns(2)
+    try:
+        try:
+            df_page, total = _load_page(page)
+        except Exception:
+            if page == 1:
+                raise
+            # A range past the end is a 416 from PostgREST: fetch page 1 to learn the count
+            page = 1
+            df_page, total = _load_page(page)
+        if page > max(1, -(-total // PAGE_SIZE)):  # an empty page past the end instead of a 416
+            page = max(1, -(-total // PAGE_SIZE))
+            df_page, total = _load_page(page)
+    except Exception as e:
+        st.error(f"Failed to load prospects: {e}")
+        df_page, total = pd.DataFrame(columns=PROSPECT_COLUMNS), 0
+        page = 1
+    total_pages = max(1, -(-total // PAGE_SIZE))
+    st.session_state["prospect_page"] = page  # the widget shows the page actually loaded
+
+    if total:
+        with st.expander("📋 View Prospects", expanded=True):
+            st.number_input("Page", min_value=1, max_value=total_pages, step=1, key="prospect_page")
+            st.caption(f"Page {page} of {total_pages} · {total} prospects")
+            st.dataframe(df_page[[c for c in df_page.columns if c != "id"]])
+
+            # ---- Search box looks up name/company/email server-side; otherwise pick from this page ----
+            search = st.text_input("Search name, company or email")
+            if search.strip():
+                try:
+                    candidates = search_prospects(USER_EMAIL, tuple(ALLOWED), IS_ADMIN, search.strip(),
+                                                  filter_clients, filter_owners)
+                except Exception as e:
+                    st.error(f"Search failed: {e}")
+                    candidates = []
+            else:
+                candidates = df_page.to_dict(orient="records")
 
-csv_bytes = export_df.to_csv(index=False).encode("utf-8")
-col_csv.download_button(
-    "Download CSV",
-    data=csv_bytes,
-    file_name="prospects_filtered.csv",
-    mime="text/csv",
-    use_container_width=True,
-)
+            # ---- Build compact selection list (labels -> id) ----
+            cand_df = pd.DataFrame(candidates, columns=["id", "first_name", "last_name", "company"])
+            cand_df = cand_df[cand_df["id"].notna()]
 
-xlsx_buffer = BytesIO()
-with pd.ExcelWriter(xlsx_buffer) as writer:
-    export_df.to_excel(writer, index=False, sheet_name="Prospects")
-xlsx_buffer.seek(0)
-col_xlsx.download_button(
-    "Download Excel (.xlsx)",
-    data=xlsx_buffer,
-    file_name="prospects_filtered.xlsx",
-    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    use_container_width=True,
-)
+            # Sticky selection by ID (order-safe)
+            label_by_id = dict(zip(cand_df["id"].tolist(), _option_labels(cand_df)))
+            ids = list(label_by_id.keys())
 
-# === Display, Search, Edit, Delete using the filtered frame ===
-def _label_from_row(r):
-    fn = (r.get("first_name") or "").strip()
-    ln = (r.get("last_name") or "").strip()
-    comp = (r.get("company") or "").strip()
-    nm = f"{fn} {ln}".strip() or "(no name)"
-    return f"{nm} — {comp}" if comp else nm
-
-if not df_filtered.empty:
-    with st.expander("📋 View Prospects", expanded=True):
-        # ---- Search box filters view by first/last/company ----
-        search = st.text_input("Search name or company")
-        df_view = df_filtered.copy()
-        if search:
-            s = search.strip().lower()
-            # Coerce missing cols
-            for c in ["first_name", "last_name", "company"]:
-                if c not in df_view.columns:
-                    df_view[c] = ""
-            df_view = df_view[df_view[["first_name", "last_name", "company"]]
-                              .astype(str).apply(lambda r: any(s in v.lower() for v in r), axis=1)]
-        st.dataframe(export_df if df_view is df_filtered else df_view[[c for c in export_df.columns if c in df_view.columns]])
-
-        # ---- Build compact selection list (labels -> id) ----
-        options = []
-        if "id" in df_view.columns:
-            for _, rr in df_view.iterrows():
-                if pd.notnull(rr.get("id")):
-                    options.append((_label_from_row(rr), rr["id"]))
-
-        # Sticky selection by ID (order-safe)
-        label_by_id = { _id: lbl for (lbl, _id) in options }
-        ids = list(label_by_id.keys())
-
-        current_id = st.session_state.get("selected_id")
-        if current_id not in label_by_id and ids:
-            current_id = ids[0]
-
-        if ids:
-            selected_id = st.selectbox(
-                "Select a prospect",
-                options=ids,
-                index=(ids.index(current_id) if current_id in ids else 0),
-                format_func=lambda _id: label_by_id.get(_id, f"ID {_id}"),
-                key="selected_id",
-            )
-            row = df_view[df_view["id"] == selected_id].iloc[0]
-        else:
-            row = None
+            current_id = st.session_state.get("selected_id")
 
-        if row is not None:
-            st.markdown("---")
-            st.subheader("✏️ Edit Prospect")
-            with st.form("edit_prospect"):
-                new_first = st.text_input("First Name", row.get("first_name", ""))
-                new_last = st.text_input("Last Name", row.get("last_name", ""))
-                new_title = st.text_input("Title", row.get("title", ""))
-                new_company = st.text_input("Company", row.get("company", ""))
-                new_phone = st.text_input("Phone", row.get("phone", ""))
-                new_email = st.text_input("Email", row.get("email", ""))
-                new_address = st.text_area("Address", row.get("address", ""))
-                new_website = st.text_input("Website", row.get("website", ""))
-                new_assigned_to = st.text_input("Assigned To (Email)", row.get("assigned_to_email", ""))
-
-                existing_clients = row.get("clients", "")
-                existing_list = [v.strip() for v in existing_clients.split(",")] if existing_clients else []
-                preselected = [c for c in existing_list if (IS_ADMIN or c in ALLOWED)]
-                new_clients = st.multiselect(
-                    "Assign to Client(s)",
-                    CLIENT_OPTIONS if IS_ADMIN else ALLOWED,
-                    preselected,
+            row = None
+            if ids:
+                # No default pick: the edit form is only built once a prospect is explicitly selected
+                selected_id = st.selectbox(
+                    "Select a prospect",
+                    options=ids,
+                    index=(ids.index(current_id) if current_id in ids else None),
+                    format_func=lambda _id: label_by_id.get(_id, f"ID {_id}"),
+                    placeholder="Choose a prospect to edit…",
+                    key="selected_id",
                 )
-
-                st.text_area("Existing Notes", row.get("notes", ""), disabled=True)
-                additional_notes = st.text_area("Notes (appended with date)", "")
-
-                # ---- No follow-up date toggle ----
-                raw_fu = row.get("follow_up_date")
-                has_no_date = pd.isna(raw_fu) or str(raw_fu).strip() in ("", "None", "NaT")
-                no_fu = st.checkbox("No follow-up date", value=has_no_date)
-                if no_fu:
-                    fu_input = None
-                else:
-                    fu_val = pd.to_datetime(raw_fu, errors="coerce")
-                    fu_val = fu_val.date() if pd.notnull(fu_val) else datetime.today().date()
-                    fu_input = st.date_input("Follow-Up Date", value=fu_val)
-
-                updated = st.form_submit_button("Update Prospect")
-
-                if updated:
-                    old_notes = row.get("notes")
-                    appended_notes = str(old_notes) if pd.notnull(old_notes) else ""
-                    if additional_notes:
-                        today_str = date.today().strftime("%Y-%m-%d")
-                        appended_notes += f"[{today_str}] {additional_notes}"
-
-                    safe_new_clients = new_clients if IS_ADMIN else [c for c in new_clients if c in ALLOWED]
-                    update_data = {
-                        "first_name": new_first,
-                        "last_name": new_last,
-                        "title": new_title,
-                        "company": new_company,
-                        "phone": new_phone,
-                        "email": new_email,
-                        "address": new_address,
-                        "website": new_website,
-                        "assigned_to_email": new_assigned_to,
-                        "follow_up_date": (None if no_fu else fu_input.strftime("%Y-%m-%d")),
-                        "clients": ",".join(safe_new_clients),
-                        "notes": appended_notes,
-                    }
-
-                    if "id" in row and pd.notnull(row["id"]):
-                        try:
+                # Lazy-load the edit target by id
+                if selected_id is not None:
+                    try:
+                        row = fetch_prospect(USER_EMAIL, selected_id)
+                    except Exception as e:
+                        st.error(f"Failed to load prospect: {e}")
+                    # Show queued (not yet saved) values so a second edit builds on the first
+                    if row is not None and row.get("id") in pending_edits:
+                        row = {**row, **pending_edits[row["id"]]}
+            elif search.strip():
+                st.info("No prospects match that search.")
+
+            if row is not None:
+                st.markdown("---")
+                st.subheader("✏️ Edit Prospect")
+                with st.form("edit_prospect"):
+                    new_first = st.text_input("First Name", row.get("first_name", ""))
+                    new_last = st.text_input("Last Name", row.get("last_name", ""))
+                    new_title = st.text_input("Title", row.get("title", ""))
+                    new_company = st.text_input("Company", row.get("company", ""))
+                    new_phone = st.text_input("Phone", row.get("phone", ""))
+                    new_email = st.text_input("Email", row.get("email", ""))
+                    new_address = st.text_area("Address", row.get("address", ""))
+                    new_website = st.text_input("Website", row.get("website", ""))
+                    new_assigned_to = st.text_input("Assigned To (Email)", row.get("assigned_to_email", ""))
+
+                    existing_clients = row.get("clients", "")
+                    existing_list = [v.strip() for v in existing_clients.split(",")] if existing_clients else []
+                    # Only codes present in the multiselect options (a stale code would make the default invalid)
+                    preselected = [c for c in existing_list if c in (CLIENT_OPTIONS_SET if IS_ADMIN else ALLOWED_SET)]
+                    new_clients = st.multiselect(
+                        "Assign to Client(s)",
+                        CLIENT_OPTIONS if IS_ADMIN else ALLOWED,
+                        preselected,
+                    )
+
+                    st.text_area("Existing Notes", row.get("notes", ""), disabled=True)
+                    additional_notes = st.text_area("Notes (appended with date)", "")
+
+                    # ---- No follow-up date toggle ----
+                    raw_fu = row.get("follow_up_date")
+                    has_no_date = pd.isna(raw_fu) or str(raw_fu).strip() in ("", "None", "NaT")
+                    no_fu = st.checkbox("No follow-up date", value=has_no_date)
+                    if no_fu:
+                        fu_input = None
+                    else:
+                        fu_val = pd.to_datetime(raw_fu, errors="coerce")
+                        fu_val = fu_val.date() if pd.notnull(fu_val) else datetime.today().date()
+                        fu_input = st.date_input("Follow-Up Date", value=fu_val)
+
+                    updated = st.form_submit_button("Update Prospect")
+
+                    if updated:
+                        old_notes = row.get("notes")
+                        appended_notes = str(old_notes) if pd.notnull(old_notes) else ""
+                        if additional_notes:
+                            today_str = date.today().strftime("%Y-%m-%d")
+                            appended_notes += f"[{today_str}] {additional_notes}"
+
+                        safe_new_clients = new_clients if IS_ADMIN else [c for c in new_clients if c in ALLOWED_SET]
+                        update_data = {
+                            "first_name": new_first,
+                            "last_name": new_last,
+                            "title": new_title,
+                            "company": new_company,
+                            "phone": new_phone,
+                            "email": new_email,
+                            "address": new_address,
+                            "website": new_website,
+                            "assigned_to_email": new_assigned_to,
+                            "follow_up_date": (None if no_fu else fu_input.strftime("%Y-%m-%d")),
+                            "clients": ",".join(safe_new_clients),
+                            "notes": appended_notes,
+                        }
+
+                        if "id" in row and pd.notnull(row["id"]):
+                            update_data["id"] = row["id"]
                             update_data["notes"] = str(update_data["notes"])
-                            resp = supabase.table("prospects").update(update_data).eq("id", row["id"]).execute()
-                            if getattr(resp, "data", None):
-                                st.success("Prospect updated.")
-                                subject = f"Follow-Up Updated: {new_first} {new_last}"
-                                body = f"The follow-up for {new_first} {new_last} at {new_company} has been updated to {(fu_input if fu_input else 'No Date')}."
-                                if new_assigned_to:
-                                    send_email(new_assigned_to, subject, body)
+                            pending_edits[row["id"]] = update_data
+                            subject = f"Follow-Up Updated: {new_first} {new_last}"
+                            body = f"The follow-up for {new_first} {new_last} at {new_company} has been updated to {(fu_input if fu_input else 'No Date')}."
+                            if new_assigned_to:
+                                pending_emails[row["id"]] = (new_assigned_to, subject, body)
                             else:
-                                err = getattr(resp, "error", None)
-                                st.error(f"Failed to update prospect. {err or 'No rows returned.'}")
-                        except Exception as e:
-                            st.error(f"Failed to update prospect: {e}")
+                                pending_emails.pop(row["id"], None)
+                            st.session_state["_flash"] = "Edit queued. Use “Save pending edits” to write all queued edits at once."
+                            st.rerun(scope="fragment")  # show the Save button now, no DB read needed
+                        else:
+                            st.error("Prospect ID not found. Cannot update.")
+
+                if st.button("🗑️ Delete Prospect"):
+                    if row is not None and "id" in row and row["id"]:
+                        _, err = exec_sb(supabase.table("prospects").delete().eq("id", row["id"]), expect_rows=False)
+                        if err:
+                            st.error(f"Failed to delete prospect: {err}")
+                        else:
+                            pending_edits.pop(row["id"], None)
+                            pending_emails.pop(row["id"], None)
+                            _invalidate_prospects()
+                            st.session_state["_flash"] = "Prospect deleted."
+                            st.rerun()
                     else:
-                        st.error("Prospect ID not found. Cannot update.")
+                        st.error("Prospect ID not found. Cannot delete.")
+    else:
+        st.info("No prospects match the selected filters.")
 
-            if st.button("🗑️ Delete Prospect"):
-                if row is not None and "id" in row and row["id"]:
-                    try:
-                        resp = supabase.table("prospects").delete().eq("id", row["id"]).execute()
-                        st.success("Prospect deleted. You may need to reload to see it removed from the list.")
-                    except Exception as e:
-                        st.error(f"Failed to delete prospect: {e}")
-                else:
-                    st.error("Prospect ID not found. Cannot delete.")
-else:
-    st.info("No prospects match the selected filters.")
+_prospect_view(tuple(filter_clients), tuple(filter_owners))
 
 # === Reminders UI ONLY (no email / no DB writes) ===
 # Shows overdue + next 7 days for visibility inside the app; sending is handled by the scheduled script.
@@ -529,20 +982,30 @@ window_end = _today + timedelta(days=REMINDER_WINDOW_DAYS)
 
 st.subheader("🔔 Follow-Ups: Overdue + Next 7 Days (UI only)")
 
-if not df.empty:
-    df_rem = df.copy()
-    df_rem["follow_up_date"] = pd.to_datetime(df_rem["follow_up_date"], errors="coerce").dt.date
-    due = df_rem[df_rem["follow_up_date"] <= window_end].copy()
+try:
+    df_rem = load_due_prospects(USER_EMAIL, tuple(ALLOWED), IS_ADMIN, window_end.isoformat())
+except Exception as e:
+    st.error(f"Failed to load follow-ups: {e}")
+    df_rem = None  # not "nothing due": skip the panel below
+
+if df_rem is not None and not df_rem.empty:
+    # Keep datetime64 so the window check is a vectorized compare against a Timestamp;
+    # follow_up_date is a Postgres date, so PostgREST always sends ISO and format= skips inference
+    df_rem["follow_up_date"] = pd.to_datetime(df_rem["follow_up_date"], format="%Y-%m-%d", errors="coerce")
+    today_ts = pd.Timestamp(_today)
+    due = df_rem[df_rem["follow_up_date"].le(pd.Timestamp(window_end))].copy()
 
     if not due.empty:
         # Add a simple status column for readability
-        due["status"] = due["follow_up_date"].apply(lambda d: "OVERDUE" if d < _today else f"Due {d}")
+        fu = due["follow_up_date"]
+        due["status"] = ("Due " + fu.dt.strftime("%Y-%m-%d")).where(fu >= today_ts, "OVERDUE")
+        due["follow_up_date"] = due["follow_up_date"].dt.date
         st.table(due[["first_name", "last_name", "company", "follow_up_date", "status", "assigned_to_email"]])
         st.info("Email reminders are sent by the scheduled job only. No emails are sent from this UI.")
     else:
         st.success("No due or overdue follow-ups within the next 7 days!")
-else:
-    st.info("No prospects found.")
+elif df_rem is not None:
+    st.success("No due or overdue follow-ups within the next 7 days!")
 
 
 
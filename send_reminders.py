@@ -6,81 +6,202 @@ Should be scheduled (daily/weekly) via cron, GitHub Actions, or Supabase Edge Fu
 """
 
 import os
-import sys
+import functools
 from datetime import datetime, timedelta, date
 from zoneinfo import ZoneInfo
-from collections import defaultdict
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import pandas as pd
+import ssl
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from collections import defaultdict, namedtuple
+from itertools import chain
 from supabase import create_client, Client
 
 # === CONFIG ===
-SUPABASE_URL = os.environ["SUPABASE_URL"]
-# Prefer service role for scheduled job; fall back to regular key if provided
-SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ["SUPABASE_KEY"]
-EMAIL_HOST = os.environ["EMAIL_HOST"]
-EMAIL_PORT = int(os.environ["EMAIL_PORT"])
-EMAIL_USER = os.environ["EMAIL_USER"]
-EMAIL_PASSWORD = os.environ["EMAIL_PASSWORD"]
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-from datetime import datetime
-import sys
-
-# --- Fetch reminder frequency from Supabase ---
-try:
-    res = supabase.table("reminder_settings").select("frequency").single().execute()
-    frequency = (res.data or {}).get("frequency", "daily")
-except Exception:
-    frequency = "daily"  # fallback default
-
-# --- Apply frequency rules ---
-if frequency == "off":
-    print("Reminders disabled by admin.")
-    sys.exit(0)
-
-# Weekly = only run on Mondays (weekday 0)
-if frequency == "weekly" and datetime.today().weekday() != 0:
-    print("Weekly reminders only fire on Monday.")
-    sys.exit(0)
-
-print(f"Reminder frequency is '{frequency}' → proceeding to send reminders…")
-
-# === Email sending helper ===
-def send_email(to_address, subject, body):
-    msg = MIMEMultipart()
-    msg['From'] = EMAIL_USER
+# Parallel SMTP sessions for digests; keep within the provider's concurrent-connection limit
+SMTP_WORKERS = int(os.environ.get("SMTP_WORKERS") or "4")  # empty (unset Actions variable) -> default
+# Log in afresh after this many messages on one session (providers throttle/drop very long sessions)
+SMTP_MAX_PER_SESSION = 100
+# Ids per in.() filter on the last_reminded_on update; keeps each request URL well under proxy limits
+UPDATE_CHUNK_IDS = 500
+# "Today" for due/overdue and the once-per-day gate is the New York calendar date
+_TZ = ZoneInfo("America/New_York")
+
+# Credentials are read on first use, so importing this module needs no env vars or network
+@functools.lru_cache(maxsize=1)
+def get_supabase() -> Client:
+    # Prefer service role for scheduled job; fall back to regular key if provided
+    key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ["SUPABASE_KEY"]
+    return create_client(os.environ["SUPABASE_URL"], key)
+
+@functools.lru_cache(maxsize=1)
+def get_smtp_config() -> dict:
+    return {
+        "host": os.environ["EMAIL_HOST"],
+        "port": int(os.environ["EMAIL_PORT"]),
+        "user": os.environ["EMAIL_USER"],
+        "password": os.environ["EMAIL_PASSWORD"],
+        # Implicit TLS (SMTPS, usually port 465): skips the EHLO/STARTTLS round-trips before LOGIN
+        "use_ssl": os.environ.get("EMAIL_USE_SSL", "").strip().lower() in ("1", "true", "yes"),
+    }
+
+# === Email sending helpers ===
+def build_msg(to_address, subject, body):
+    # Single-part text/plain; a multipart/mixed wrapper adds nothing for a plain digest
+    msg = EmailMessage()
+    msg['From'] = get_smtp_config()["user"]
     msg['To'] = to_address
     msg['Subject'] = subject
-    msg.attach(MIMEText(body, 'plain'))
+    msg.set_content(body)
+    return msg
+
+def smtp_login():
+    cfg = get_smtp_config()
+    context = ssl.create_default_context()
+    if cfg["use_ssl"]:
+        server = smtplib.SMTP_SSL(cfg["host"], cfg["port"], context=context)
+    else:
+        server = smtplib.SMTP(cfg["host"], cfg["port"])
+        server.starttls(context=context)
+    server.login(cfg["user"], cfg["password"])
+    return server
+
+def send_bulk(messages):
+    """Send (to, subject, body) tuples over up to SMTP_WORKERS sessions, one per worker thread;
+    return the recipients that were accepted. A session is recycled every SMTP_MAX_PER_SESSION
+    messages, and one dropped mid-run logs in again once."""
+    local = threading.local()
+    sessions = {}  # thread id -> that worker's live session, closed at the end
+
+    def connect():
+        # Close the session being replaced now, so recycling never holds extra logins open
+        old = getattr(local, "server", None)
+        local.server = None
+        if old is not None:
+            try:
+                old.quit()
+            except OSError:
+                pass
+        local.server = sessions[threading.get_ident()] = smtp_login()
+        local.sent = 0
+
+    def deliver(to_address, subject, body):
+        msg = build_msg(to_address, subject, body)
+        try:
+            if getattr(local, "server", None) is None or local.sent >= SMTP_MAX_PER_SESSION:
+                connect()
+            try:
+                local.server.send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                connect()
+                local.server.send_message(msg)
+            local.sent += 1
+            return to_address
+        except OSError as e:  # SMTPException and socket errors; keep going so other sends still count
+            print(f"Failed to send to {to_address}: {e}")
+            return None
 
-    with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT) as server:
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        server.send_message(msg)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(SMTP_WORKERS, len(messages)))) as pool:
+            return {to for to in pool.map(lambda m: deliver(*m), messages) if to}
+    finally:
+        for server in sessions.values():
+            try:
+                server.quit()
+            except OSError:
+                pass
 
 # === Step 1: Check settings for frequency ===
+REMINDER_FREQUENCIES = ("daily", "weekly", "off")
+
+@functools.lru_cache(maxsize=1)
 def get_reminder_frequency():
+    """reminder_settings.frequency (row id = 1, written by the admin UI); read once per run."""
     try:
-        res = supabase.table("app_settings").select("*").eq("key", "reminder_frequency").single().execute()
+        res = get_supabase().table("reminder_settings").select("frequency").eq("id", 1).single().execute()
         data = getattr(res, "data", None) or {}
-        return data.get("value", "daily")  # default daily
+        return (data.get("frequency") or "daily").strip().lower()  # default daily
     except Exception:
         return "daily"
 
-# === Step 2: Load prospects ===
-def load_prospects():
-    res = supabase.table("prospects").select("*").execute()
-    df = pd.DataFrame(getattr(res, "data", []) or [])
-    return df
+# === Step 2: Load prospects needing a reminder ===
+REMINDER_COLUMNS = ["id", "first_name", "last_name", "company", "follow_up_date", "assigned_to_email"]
+
+def load_prospects(window_end, today):
+    """Due/overdue rows with a recipient that haven't been reminded today; the filtering runs in Postgres."""
+    res = (
+        get_supabase().table("prospects")
+        .select(",".join(REMINDER_COLUMNS))
+        .lte("follow_up_date", window_end.isoformat())
+        .neq("assigned_to_email", "")
+        .or_(f"last_reminded_on.is.null,last_reminded_on.neq.{today.isoformat()}")
+        .execute()
+    )
+    return getattr(res, "data", []) or []
+
+DigestItem = namedtuple("DigestItem", "id line")
+
+def _parse_date(value):
+    """ISO date string from PostgREST -> date (None if missing/unparseable)."""
+    try:
+        return date.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+def group_rows(rows, today):
+    """{recipient: [DigestItem]} from load_prospects rows (plain dicts; no DataFrame for a small window)."""
+    batches = defaultdict(list)
+    for r in rows:
+        recipient = (r.get("assigned_to_email") or "").strip()
+        if not recipient:
+            continue
+        fu = _parse_date(r.get("follow_up_date"))
+        status = f"Due {fu.isoformat()}" if fu and fu >= today else "OVERDUE"
+        line = f"- {r.get('first_name') or ''} {r.get('last_name') or ''} @ {r.get('company') or ''}  [{status}]"
+        batches[recipient].append(DigestItem(r.get("id"), line))
+    return batches
+
+def load_digests(window_end, today):
+    """Same {recipient: [DigestItem]}, grouped and formatted in Postgres by the reminder_digest RPC
+    (see README). None if the function isn't installed."""
+    try:
+        res = get_supabase().rpc(
+            "reminder_digest", {"p_today": today.isoformat(), "p_window": window_end.isoformat()}
+        ).execute()
+    except Exception:
+        return None
+    return {
+        g["email"]: [DigestItem(pid, line) for pid, line in zip(g["ids"], g["lines"])]
+        for g in (getattr(res, "data", []) or [])
+    }
+
+def mark_reminded(ids, today):
+    """Set last_reminded_on = today for ids, UPDATE_CHUNK_IDS per request (a few in parallel);
+    return how many were marked."""
+    chunks = [ids[i:i + UPDATE_CHUNK_IDS] for i in range(0, len(ids), UPDATE_CHUNK_IDS)]
+    payload = {"last_reminded_on": today.isoformat()}  # same body for every chunk
+
+    def update(chunk):
+        try:
+            get_supabase().table("prospects").update(payload).in_("id", chunk).execute()
+            return len(chunk)
+        except Exception as e:
+            print(f"Failed to update last_reminded_on for {len(chunk)} prospects: {e}")
+            return 0
+
+    with ThreadPoolExecutor(max_workers=max(1, min(4, len(chunks)))) as pool:
+        return sum(pool.map(update, chunks))
 
 # === Step 3: Send digests ===
 def run_reminders():
-    freq = get_reminder_frequency()
-    today = datetime.now(ZoneInfo("America/New_York")).date()
+    # REMINDER_FREQUENCY (env) overrides the admin setting and skips the settings round-trip
+    freq = (os.environ.get("REMINDER_FREQUENCY") or "").strip().lower() or get_reminder_frequency()
+    if freq not in REMINDER_FREQUENCIES:
+        # A typo must not quietly turn into daily sends
+        print(f"Unknown reminder frequency '{freq}' (expected one of {', '.join(REMINDER_FREQUENCIES)}); not sending.")
+        return
+    today = datetime.now(_TZ).date()
 
     # Respect frequency
     if freq == "off":
@@ -89,56 +210,40 @@ def run_reminders():
     if freq == "weekly" and today.weekday() != 0:  # Monday only
         print("Weekly reminders only fire on Monday.")
         return
-
-    df = load_prospects()
-    if df.empty:
-        print("No prospects found.")
-        return
-
-    # Normalize follow_up_date
-    df["follow_up_date"] = pd.to_datetime(df["follow_up_date"], errors="coerce").dt.date
-    if "last_reminded_on" not in df.columns:
-        df["last_reminded_on"] = None
-    else:
-        df["last_reminded_on"] = pd.to_datetime(df["last_reminded_on"], errors="coerce").dt.date
+    print(f"Reminder frequency is '{freq}' → proceeding to send reminders…")
 
     window_end = today + timedelta(days=7)
-    due = df[df["follow_up_date"] <= window_end].copy()
-
-    if due.empty:
-        print("No due or overdue follow-ups.")
+    batches = load_digests(window_end, today)
+    if batches is None:
+        batches = group_rows(load_prospects(window_end, today), today)
+    if not batches:
+        print("No due or overdue follow-ups needing a reminder.")
         return
 
-    due_needing_email = due[(due["last_reminded_on"] != today) | (due["last_reminded_on"].isna())].copy()
+    subject = "Follow-Up Digest: Overdue & Upcoming (7 days)"
+    messages = []
+    header = ["Here are your follow-ups that are overdue or due within the next 7 days:", ""]
+    footer = ["", "— Client Prospect CRM"]
+    for recipient, items in batches.items():
+        body = "\n".join(chain(header, (it.line for it in items), footer))
+        messages.append((recipient, subject, body))
 
-    batches = defaultdict(list)
-    for _, r in due_needing_email.iterrows():
-        recipient = (r.get("assigned_to_email") or "").strip()
-        if recipient:
-            status = "OVERDUE" if r["follow_up_date"] < today else f"Due {r['follow_up_date']}"
-            line = f"- {r.get('first_name','')} {r.get('last_name','')} @ {r.get('company','')}  [{status}]"
-            batches[recipient].append({"id": r.get("id"), "line": line})
+    # A few long-lived SMTP sessions sending in parallel instead of a connect/STARTTLS/login per recipient
+    try:
+        delivered = send_bulk(messages)
+    except Exception as e:
+        print(f"Failed to send digests: {e}")
+        delivered = set()
 
+    # Ids of prospects whose digest actually went out; marked in bulk below
+    sent_ids = []
     for recipient, items in batches.items():
-        body_lines = [
-            "Here are your follow-ups that are overdue or due within the next 7 days:",
-            "",
-            *[it["line"] for it in items],
-            "",
-            "— Client Prospect CRM",
-        ]
-        subject = "Follow-Up Digest: Overdue & Upcoming (7 days)"
-        try:
-            send_email(recipient, subject, "\n".join(body_lines))
+        if recipient in delivered:
             print(f"Sent digest to {recipient}")
+            sent_ids.extend(it.id for it in items if it.id)
 
-            ids = [it["id"] for it in items if it["id"]]
-            if ids:
-                supabase.table("prospects").update(
-                    {"last_reminded_on": today.isoformat()}
-                ).in_("id", ids).execute()
-        except Exception as e:
-            print(f"Failed to send to {recipient}: {e}")
+    if sent_ids:
+        print(f"Marked {mark_reminded(sent_ids, today)} of {len(sent_ids)} prospects as reminded on {today}")
 
 if __name__ == "__main__":
     run_reminders()